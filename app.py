@@ -1,21 +1,71 @@
 import streamlit as st
 from data_loader import debtor_data
-from chatbot import cap_chatbot
 import redis
 import logging
 import json
 from uuid import uuid4
 
+# Préfixe des clés Redis des sessions Streamlit et durée de vie en secondes
+SESSION_PREFIX = "streamlit:"
+SESSION_EXPIRATION = 3600
+CLEANUP_INTERVAL_SECONDS = 600
+
+@st.cache_resource
+def get_chatbot():
+    """
+    Charge le chatbot (modèle et index) une seule fois par processus.
+    """
+    from chatbot import cap_chatbot
+    return cap_chatbot
+
+@st.cache_resource
+def get_redis_client():
+    """
+    Crée un client Redis adossé à un pool de connexions partagé par le processus.
+    """
+    pool = redis.ConnectionPool(host='localhost', port=6379, db=0, decode_responses=True)
+    client = redis.StrictRedis(connection_pool=pool)
+    client.ping()
+    return client
+
+@st.cache_resource
+def get_debtor_lookup():
+    """
+    Construit une seule fois la table de recherche des débiteurs.
+
+    Returns:
+        dict: Données du débiteur indexées par (prénom, nom, code client) normalisés.
+    """
+    lookup = {}
+    for record in debtor_data.to_dict('records'):
+        key = (
+            str(record['prenom_debiteur']).strip().lower(),
+            str(record['nom_debiteur']).strip().lower(),
+            str(record['code_client']).strip(),
+        )
+        lookup.setdefault(key, record)
+    return lookup
+
+def find_debtor(first_name, last_name, code_client):
+    """
+    Recherche un débiteur dans la table normalisée.
+
+    Returns:
+        dict or None: Les données du débiteur si trouvées, sinon None.
+    """
+    return get_debtor_lookup().get((first_name.strip().lower(), last_name.strip().lower(), code_client.strip()))
+
 st.title("CAP Recouvrement Chatbot")
 
 # Connecter à Redis pour la persistance des sessions
 try:
-    redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
-    redis_client.ping()
+    redis_client = get_redis_client()
 except redis.ConnectionError:
     st.error("Impossible de se connecter à Redis. Veuillez vérifier que le serveur Redis est en cours d'exécution !")
     st.stop()
 
+cap_chatbot = get_chatbot()
+
 def get_session(session_id):
     """
     Récupère les données de session depuis Redis.
@@ -26,7 +76,7 @@ def get_session(session_id):
     Returns:
         dict: Données de session, ou un dictionnaire par défaut si la session n'existe pas.
     """
-    session_data = redis_client.get(session_id)
+    session_data = redis_client.get(SESSION_PREFIX + session_id)
     if session_data:
         try:
             return json.loads(session_data)
@@ -45,14 +95,13 @@ def save_session(session_id, session_data):
         session_id (str): Identifiant de la session.
         session_data (dict): Données de session à enregistrer.
     """
-    redis_client.set(session_id, json.dumps(session_data))
+    redis_client.set(SESSION_PREFIX + session_id, json.dumps(session_data), ex=SESSION_EXPIRATION)
 
 def clean_old_sessions():
     """
     Supprime les sessions obsolètes de Redis après une période d'inactivité définie.
     """
-    session_keys = redis_client.keys()
-    for key in session_keys:
+    for key in redis_client.scan_iter(match=SESSION_PREFIX + "*"):
         session_data = redis_client.get(key)
         if session_data:
             try:
@@ -66,6 +115,14 @@ def clean_old_sessions():
                 # Optionally handle this error, such as deleting the invalid session
                 redis_client.delete(key)  # Remove corrupted session data
 
+@st.cache_resource(ttl=CLEANUP_INTERVAL_SECONDS)
+def schedule_cleanup():
+    """
+    Nettoie les sessions obsolètes au plus une fois par CLEANUP_INTERVAL_SECONDS et par processus.
+    """
+    clean_old_sessions()
+    return True
+
 # Initialiser les variables de session
 session_id = st.session_state.get('session_id', None)
 if not session_id:
@@ -81,12 +138,8 @@ if not session_data['user_verified']:
 
     if st.button("Se Connecter"):
         if first_name and last_name:
-            debtor_data['prenom_debiteur'] = debtor_data['prenom_debiteur'].str.strip().str.lower()
-            debtor_data['nom_debiteur'] = debtor_data['nom_debiteur'].str.strip().str.lower()
-            user = debtor_data[(debtor_data['prenom_debiteur'] == first_name) &
-                               (debtor_data['nom_debiteur'] == last_name) &
-                               (debtor_data['code_client'].astype(str) == code_client)]
-            if not user.empty:
+            user = find_debtor(first_name, last_name, code_client)
+            if user is not None:
                 session_data['user_verified'] = True
                 session_data['first_name'] = first_name
                 session_data['last_name'] = last_name
@@ -104,7 +157,11 @@ if session_data['user_verified']:
     user_input = st.text_input("Posez votre question")
    
     if st.button("Envoyer") and user_input:
-        response = cap_chatbot.get_response(user_input, first_name, last_name, code_client, debtor_data)
+        user = find_debtor(first_name, last_name, code_client)
+        if user is not None:
+            response = cap_chatbot.respond(user_input, user)
+        else:
+            response = "Je ne trouve pas vos informations dans notre base de données."
         session_data['qa_history'].append((user_input, response))
         save_session(session_id, session_data)
    
@@ -121,4 +178,4 @@ if session_data['user_verified']:
         save_session(session_id, session_data)
         st.write("Au revoir ! Passez une bonne journée !")
 
-clean_old_sessions()  # Nettoyer les sessions obsolètes
+schedule_cleanup()  # Nettoyer les sessions obsolètes
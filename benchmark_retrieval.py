@@ -0,0 +1,245 @@
+"""
+Banc d'essai hors ligne de la recherche de réponses du chatbot.
+
+Mesure, pour chaque combinaison encodeur / pooling / index, la précision top-1 et
+top-k sur un jeu de questions reformulées (data/eval_questions.txt, français et
+anglais) ainsi que le débit d'embedding, la latence d'encodage et de recherche
+et l'empreinte mémoire. Les résultats sont ajoutés à un fichier CSV pour pouvoir
+comparer les configurations d'une exécution à l'autre.
+
+Exemple:
+    python benchmark_retrieval.py --pooling cls mean --index flat_l2 flat_ip hnsw
+"""
+import argparse
+import csv
+import logging
+import os
+import time
+from datetime import datetime
+
+import faiss
+import numpy as np
+from transformers import AutoTokenizer, TFAutoModel
+
+from faq_loader import CHATBOT_DATA_PATH, load_chatbot_data
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODER = 'sentence-transformers/all-MiniLM-L6-v2'
+EVAL_DATA_PATH = 'data/eval_questions.txt'
+RESULTS_PATH = 'retrieval_benchmark.csv'
+
+POOLINGS = ('cls', 'mean')
+INDEX_TYPES = ('flat_l2', 'flat_ip', 'hnsw')
+
+RESULT_FIELDS = [
+    'timestamp', 'encoder', 'pooling', 'index', 'k', 'n_questions',
+    'top1', 'topk', 'top1_fr', 'top1_en',
+    'embed_throughput_qps', 'encode_p50_ms', 'search_p50_ms', 'search_p95_ms',
+    'index_bytes', 'model_bytes',
+]
+
+def normalize_question(question):
+    """
+    Normalise une question pour la comparaison (espaces et BOM éventuel).
+    """
+    return question.replace('\ufeff', '').strip()
+
+def load_eval_set(file_path):
+    """
+    Charge le jeu d'évaluation au format `langue::question reformulée::question attendue`.
+
+    Args:
+        file_path (str): Chemin vers le fichier d'évaluation.
+
+    Returns:
+        list: Liste de tuples (langue, question, question attendue).
+    """
+    eval_set = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if '::' not in line:
+                continue
+            parts = line.strip().split('::')
+            if len(parts) != 3:
+                raise ValueError(f"Ligne d'évaluation invalide: {line.strip()}")
+            lang, question, expected = parts
+            eval_set.append((lang, question, normalize_question(expected)))
+    return eval_set
+
+def embed(tokenizer, model, texts, pooling, batch_size=32):
+    """
+    Calcule les embeddings d'une liste de textes.
+
+    Args:
+        tokenizer: Tokenizer transformers.
+        model: Modèle TF transformers.
+        texts (list): Textes à encoder.
+        pooling (str): 'cls' (premier token, comme le chatbot) ou 'mean' (moyenne masquée).
+        batch_size (int, optional): Taille du batch. Par défaut 32.
+
+    Returns:
+        np.ndarray: Embeddings float32 de forme (len(texts), dim).
+    """
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        inputs = tokenizer(texts[i:i+batch_size], return_tensors="tf", padding=True, truncation=True)
+        hidden = model(**inputs).last_hidden_state.numpy()
+        if pooling == 'cls':
+            embeddings.append(hidden[:, 0, :])
+        elif pooling == 'mean':
+            mask = inputs['attention_mask'].numpy()[:, :, None].astype('float32')
+            embeddings.append((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+        else:
+            raise ValueError(f"Pooling inconnu: {pooling}")
+    return np.vstack(embeddings).astype('float32')
+
+def build_index(embeddings, index_type):
+    """
+    Construit un index FAISS du type demandé.
+
+    Args:
+        embeddings (np.ndarray): Embeddings des questions de référence.
+        index_type (str): 'flat_l2' (comme le chatbot), 'flat_ip' (cosinus) ou 'hnsw'.
+
+    Returns:
+        faiss.Index: L'index construit.
+    """
+    dim = embeddings.shape[1]
+    if index_type == 'flat_l2':
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == 'flat_ip':
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, 32)
+    else:
+        raise ValueError(f"Type d'index inconnu: {index_type}")
+    index.add(prepare_vectors(embeddings, index_type))
+    return index
+
+def prepare_vectors(vectors, index_type):
+    """
+    Normalise les vecteurs pour l'index cosinus, les laisse inchangés sinon.
+    """
+    if index_type == 'flat_ip':
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+def model_size(model):
+    """
+    Estime la taille en octets des poids du modèle.
+    """
+    return int(sum(np.prod(weight.shape) * weight.dtype.size for weight in model.weights))
+
+def language_accuracy(hits_by_lang, lang):
+    """
+    Précision top-1 pour une langue, ou une valeur vide si elle est absente du jeu d'évaluation.
+    """
+    hits = hits_by_lang.get(lang)
+    return round(float(np.mean(hits)), 4) if hits else ''
+
+def evaluate(tokenizer, model, qa_pairs, eval_set, pooling, index_type, k):
+    """
+    Évalue une configuration encodeur / pooling / index.
+
+    Une réponse est correcte si l'entrée retrouvée porte l'une des réponses de la
+    question attendue : plusieurs questions de Data_Chatbot.txt partagent une
+    réponse, et une même question peut apparaître plusieurs fois avec des réponses
+    différentes.
+
+    Returns:
+        dict: Une ligne de résultats (voir RESULT_FIELDS).
+    """
+    questions = [normalize_question(q) for q, _ in qa_pairs]
+    responses = [r for _, r in qa_pairs]
+    responses_by_question = {}
+    for question, response in zip(questions, responses):
+        responses_by_question.setdefault(question, set()).add(response)
+
+    # Premier appel hors chronométrage : il inclut l'initialisation du graphe TF
+    embed(tokenizer, model, questions[:32], pooling)
+    start = time.perf_counter()
+    reference = embed(tokenizer, model, questions, pooling)
+    embed_throughput = len(questions) / (time.perf_counter() - start)
+    index = build_index(reference, index_type)
+
+    encode_times, search_times = [], []
+    hits_top1, hits_topk = [], []
+    hits_by_lang = {}
+    for lang, question, expected in eval_set:
+        if expected not in responses_by_question:
+            raise ValueError(f"Question attendue absente de {CHATBOT_DATA_PATH}: {expected}")
+        start = time.perf_counter()
+        query = prepare_vectors(embed(tokenizer, model, [question], pooling), index_type)
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _, I = index.search(query, k)
+        search_times.append(time.perf_counter() - start)
+
+        retrieved = [responses[i] for i in I[0] if i != -1]
+        expected_responses = responses_by_question[expected]
+        top1 = bool(retrieved) and retrieved[0] in expected_responses
+        hits_top1.append(top1)
+        hits_topk.append(any(response in expected_responses for response in retrieved))
+        hits_by_lang.setdefault(lang, []).append(top1)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'pooling': pooling,
+        'index': index_type,
+        'k': k,
+        'n_questions': len(eval_set),
+        'top1': round(float(np.mean(hits_top1)), 4),
+        'topk': round(float(np.mean(hits_topk)), 4),
+        'top1_fr': language_accuracy(hits_by_lang, 'fr'),
+        'top1_en': language_accuracy(hits_by_lang, 'en'),
+        'embed_throughput_qps': round(embed_throughput, 1),
+        'encode_p50_ms': round(float(np.percentile(encode_times, 50)) * 1000, 3),
+        'search_p50_ms': round(float(np.percentile(search_times, 50)) * 1000, 3),
+        'search_p95_ms': round(float(np.percentile(search_times, 95)) * 1000, 3),
+        'index_bytes': int(faiss.serialize_index(index).nbytes),
+        'model_bytes': model_size(model),
+    }
+
+def write_results(rows, file_path):
+    """
+    Ajoute les lignes de résultats au fichier CSV, en écrivant l'en-tête s'il est nouveau.
+    """
+    new_file = not os.path.exists(file_path)
+    with open(file_path, 'a', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai précision / latence de la recherche FAQ.")
+    parser.add_argument('--encoders', nargs='+', default=[DEFAULT_ENCODER])
+    parser.add_argument('--pooling', nargs='+', choices=POOLINGS, default=['cls'])
+    parser.add_argument('--index', nargs='+', choices=INDEX_TYPES, default=['flat_l2'])
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--data', default=CHATBOT_DATA_PATH)
+    parser.add_argument('--eval', default=EVAL_DATA_PATH)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    qa_pairs = load_chatbot_data(args.data)
+    eval_set = load_eval_set(args.eval)
+    rows = []
+    for encoder in args.encoders:
+        tokenizer = AutoTokenizer.from_pretrained(encoder)
+        model = TFAutoModel.from_pretrained(encoder)
+        for pooling in args.pooling:
+            for index_type in args.index:
+                row = evaluate(tokenizer, model, qa_pairs, eval_set, pooling, index_type, args.k)
+                row['encoder'] = encoder
+                rows.append(row)
+                logger.info(f"{encoder} | {pooling} | {index_type} : top-1 {row['top1']:.2%}, "
+                            f"top-{args.k} {row['topk']:.2%}, recherche p50 {row['search_p50_ms']} ms")
+    write_results(rows, args.output)
+    logger.info(f"{len(rows)} configuration(s) ajoutée(s) à {args.output}")
+
+if __name__ == '__main__':
+    main()
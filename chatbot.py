@@ -1,25 +1,23 @@
-from transformers import AutoTokenizer, TFAutoModel
 import pandas as pd
-import tensorflow as tf
 from data_loader import debtor_data
-from indexer import vector_db, metadata
+from inference_service import InferenceClient
 import logging
+import os
 from pydantic import BaseModel, ValidationError
 from collections import OrderedDict
 import re
+import threading
 
 # Configurer le logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Charger le modèle de transformers
-try:
-    tokenizer = AutoTokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
-    model = TFAutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
-    logger.info("Modèle de transformers chargé avec succès.")
-except Exception as e:
-    logger.error(f"Erreur lors du chargement du modèle de transformers: {e}")
-    raise RuntimeError(f"Erreur lors du chargement du modèle de transformers: {e}")
+# Socket du service d'inférence : s'il est défini, le modèle et l'index ne sont pas chargés dans ce processus
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+
+if not INFERENCE_SOCKET:
+    # Le modèle de transformers est chargé une seule fois, par indexer
+    from indexer import vector_db, metadata, ShardCache, search_response_template, select_shard
 
 class UserVerification(BaseModel):
     first_name: str  # Validation via la méthode validate_name
@@ -72,9 +70,11 @@ class CAPRecouvrementChatBot:
         metadata (list): Métadonnées associées aux questions-réponses.
         memory (OrderedDict): Mémoire LRU des utilisateurs pour stocker les données récentes.
         memory_limit (int): Limite du nombre d'utilisateurs stockés en mémoire.
+        shard_cache (ShardCache or None): Cache des index par créancier, None pour l'index unique.
+        inference_client (InferenceClient or None): Client du service d'inférence, None pour une recherche locale.
     """
    
-    def __init__(self, vector_db, metadata, memory_limit=100):
+    def __init__(self, vector_db, metadata, memory_limit=100, shard_cache=None, inference_client=None):
         """
         Initialise le chatbot avec la base de données vectorielle et les métadonnées.
 
@@ -82,11 +82,16 @@ class CAPRecouvrementChatBot:
             vector_db (faiss.Index): L'index FAISS pour la recherche.
             metadata (list): Liste des métadonnées pour chaque entrée de l'index.
             memory_limit (int, optional): Limite de la mémoire LRU. Par défaut 100.
+            shard_cache (ShardCache, optional): Cache des index par créancier. Par défaut None.
+            inference_client (InferenceClient, optional): Délègue la recherche au service d'inférence. Par défaut None.
         """
         self.vector_db = vector_db
         self.metadata = metadata
         self.memory = OrderedDict()  # Utilisation d'un OrderedDict pour LRU
+        self.memory_lock = threading.Lock()  # L'API appelle le chatbot depuis plusieurs threads
         self.memory_limit = memory_limit
+        self.shard_cache = shard_cache
+        self.inference_client = inference_client
         logger.info("CAPRecouvrementChatBot initialisé.")
 
     def manage_memory(self, user_key):
@@ -96,10 +101,26 @@ class CAPRecouvrementChatBot:
         Args:
             user_key (str): Clé utilisateur unique basée sur le prénom, le nom et le code client.
         """
-        if len(self.memory) >= self.memory_limit:
-            oldest_user_key = next(iter(self.memory))
-            logger.info(f"Limite de mémoire atteinte, suppression de l'utilisateur le plus ancien: {oldest_user_key}")
-            self.memory.pop(oldest_user_key)
+        with self.memory_lock:
+            if len(self.memory) >= self.memory_limit:
+                oldest_user_key = next(iter(self.memory))
+                logger.info(f"Limite de mémoire atteinte, suppression de l'utilisateur le plus ancien: {oldest_user_key}")
+                self.memory.pop(oldest_user_key)
+
+    def select_shard(self, user):
+        """
+        Sélectionne l'index et les métadonnées du créancier du débiteur.
+
+        Le shard est recherché par code client puis par raison sociale ; à défaut,
+        l'index global est utilisé.
+
+        Args:
+            user (dict): Données du débiteur.
+
+        Returns:
+            tuple: (vector_db, metadata) à utiliser pour la recherche.
+        """
+        return select_shard(self.shard_cache, user, self.vector_db, self.metadata)
 
     def get_response(self, user_input, first_name, last_name, code_client, session_id):
         """
@@ -119,41 +140,59 @@ class CAPRecouvrementChatBot:
             user = verify_user(first_name, last_name, code_client, debtor_data)
             if user is not None:
                 user_key = f"{first_name}_{last_name}_{code_client}"
-                self.memory[user_key] = user.to_dict('records')[0]
+                record = user.to_dict('records')[0]
+                with self.memory_lock:
+                    self.memory[user_key] = record
                 self.manage_memory(user_key)
-                response_template = self.find_response_template(user_input)
-                if response_template:
-                    response = self.fill_template(response_template, self.memory[user_key], user_input)
-                    return response
-                else:
-                    logger.warning("Aucun template de réponse trouvé pour l'entrée utilisateur.")
-                    return "Désolé, je ne suis pas en mesure de trouver une réponse appropriée."
+                return self.respond(user_input, record)
             else:
                 return "Je ne trouve pas vos informations dans notre base de données."
         except Exception as e:
             logger.error(f"Une erreur est survenue lors de la génération de la réponse: {e}")
             return f"Une erreur est survenue lors de la génération de la réponse: {e}"
 
-    def find_response_template(self, prompt):
+    def respond(self, user_input, user):
+        """
+        Génère une réponse pour un débiteur déjà vérifié, sans nouvelle recherche dans les données.
+
+        Args:
+            user_input (str): Question ou entrée de l'utilisateur.
+            user (dict): Données du débiteur vérifié.
+
+        Returns:
+            str: Réponse générée par le chatbot.
+        """
+        try:
+            if self.inference_client is not None:
+                response_template = self.inference_client.find_response_template(user_input, user)
+            else:
+                shard_db, shard_metadata = self.select_shard(user)
+                response_template = self.find_response_template(user_input, shard_db, shard_metadata)
+            if response_template:
+                return self.fill_template(response_template, user, user_input)
+            else:
+                logger.warning("Aucun template de réponse trouvé pour l'entrée utilisateur.")
+                return "Désolé, je ne suis pas en mesure de trouver une réponse appropriée."
+        except Exception as e:
+            logger.error(f"Une erreur est survenue lors de la génération de la réponse: {e}")
+            return f"Une erreur est survenue lors de la génération de la réponse: {e}"
+
+    def find_response_template(self, prompt, vector_db=None, metadata=None):
         """
         Recherche le template de réponse correspondant à l'entrée utilisateur.
 
         Args:
             prompt (str): Entrée utilisateur.
+            vector_db (faiss.Index, optional): Index à interroger. Par défaut l'index global.
+            metadata (list, optional): Métadonnées associées à vector_db.
 
         Returns:
             str or None: Template de réponse trouvé ou None si aucun template n'est trouvé.
         """
+        if vector_db is None:
+            vector_db, metadata = self.vector_db, self.metadata
         try:
-            inputs = tokenizer(prompt, return_tensors="tf")
-            outputs = model(**inputs)
-            user_input_embedding = outputs.last_hidden_state[:, 0, :].numpy().reshape(1, -1)
-            D, I = self.vector_db.search(user_input_embedding, k=1)
-            if I[0][0] != -1:
-                response_template = self.metadata[I[0][0]]['response']
-                return response_template
-            else:
-                return None
+            return search_response_template(prompt, vector_db, metadata)
         except Exception as e:
             logger.error(f"Erreur lors de la recherche du template de réponse: {e}")
             return None
@@ -201,5 +240,8 @@ class CAPRecouvrementChatBot:
             return "Une erreur est survenue lors de la préparation de votre réponse."
 
 # Initialiser le chatbot
-cap_chatbot = CAPRecouvrementChatBot(vector_db, metadata)
+if INFERENCE_SOCKET:
+    cap_chatbot = CAPRecouvrementChatBot(None, None, inference_client=InferenceClient(INFERENCE_SOCKET))
+else:
+    cap_chatbot = CAPRecouvrementChatBot(vector_db, metadata, shard_cache=ShardCache())
 logger.info("Chatbot CAPRecouvrementChatBot initialisé.")
@@ -4,6 +4,7 @@ from cryptography.fernet import Fernet
 import json
 import os
 from dotenv import load_dotenv
+from faq_loader import load_chatbot_data, CHATBOT_DATA_PATH
 
 load_dotenv()
 
@@ -75,27 +76,6 @@ def load_excel_data(file_path):
         logging.error(f"Erreur lors du chargement du fichier Excel: {e}")
         return None
 
-def load_chatbot_data(file_path):
-    """
-    Charge les données de question-réponse pour le chatbot à partir d'un fichier texte.
-
-    Args:
-        file_path (str): Chemin vers le fichier texte.
-
-    Returns:
-        list: Liste de paires question-réponse ou None si une erreur s'est produite.
-    """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            qa_pairs = [line.strip().split('::') for line in file.readlines() if '::' in line]
-            for pair in qa_pairs:
-                if len(pair) != 2:
-                    raise ValueError("Chaque ligne doit contenir exactement une question et une réponse séparées par '::'")
-            return qa_pairs
-    except Exception as e:
-        logging.error(f"Erreur lors du chargement du fichier de chatbot: {e}")
-        return None
-
 # Charger les données
 debtor_data = load_excel_data('data/Classeur.xlsx')
-qa_pairs = load_chatbot_data('data/Data_Chatbot.txt')
+qa_pairs = load_chatbot_data(CHATBOT_DATA_PATH)
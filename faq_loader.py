@@ -0,0 +1,25 @@
+import logging
+
+# Questions-réponses du chatbot ; ce module ne charge ni les débiteurs ni la clé de chiffrement
+CHATBOT_DATA_PATH = 'data/Data_Chatbot.txt'
+
+def load_chatbot_data(file_path):
+    """
+    Charge les données de question-réponse pour le chatbot à partir d'un fichier texte.
+
+    Args:
+        file_path (str): Chemin vers le fichier texte.
+
+    Returns:
+        list: Liste de paires question-réponse ou None si une erreur s'est produite.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            qa_pairs = [line.strip().split('::') for line in file.readlines() if '::' in line]
+            for pair in qa_pairs:
+                if len(pair) != 2:
+                    raise ValueError("Chaque ligne doit contenir exactement une question et une réponse séparées par '::'")
+            return qa_pairs
+    except Exception as e:
+        logging.error(f"Erreur lors du chargement du fichier de chatbot: {e}")
+        return None
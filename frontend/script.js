@@ -1,4 +1,6 @@
 let session_id = null;
+let token = null;
+let chatSocket = null;
 
 document.getElementById('chat-icon').addEventListener('click', function () {
     document.getElementById('chat-bubble').style.display = 'flex';
@@ -160,6 +162,8 @@ function handleUserCodeClient() {
         .then(data => {
             if (data.found) {
                 session_id = data.session_id;
+                token = data.token;
+                openChatSocket();
                 addBotMessage('Merci ! Que voulez-vous savoir ?');
                 addChoices([
                     { text: 'A qui dois-je de l\'argent ?', handler: () => askQuestion('A qui dois-je de l\'argent ?') },
@@ -182,12 +186,60 @@ function handleUserCodeClient() {
     }
 }
 
+function openChatSocket() {
+    // Connexion authentifiée une seule fois ; /api/chat reste utilisé si elle n'est pas ouverte
+    let socket = new WebSocket('ws://127.0.0.1:8000/ws/chat');
+    socket.onopen = function () {
+        // Le jeton est envoyé dans le premier message plutôt que dans l'URL, pour ne pas apparaître dans les logs
+        socket.send(JSON.stringify({ token: token, session_id: session_id }));
+    };
+    socket.onmessage = function (event) {
+        let question = socket.lastQuestion;
+        socket.lastQuestion = null;
+        handleChatResponse(JSON.parse(event.data), question);
+    };
+    socket.onclose = function () {
+        if (chatSocket === socket) {
+            chatSocket = null;
+        }
+        // Une question restée sans réponse à la fermeture est renvoyée via /api/chat
+        if (socket.lastQuestion) {
+            let question = socket.lastQuestion;
+            socket.lastQuestion = null;
+            sendQuestionRest(question);
+        }
+    };
+    chatSocket = socket;
+}
+
+function handleChatResponse(data, question) {
+    if (data.session_id) {
+        session_id = data.session_id;
+    }
+    addBotMessage(data.response);
+    addBotMessage('Vous avez besoin d\'autre chose ?');
+    addChoices([
+        { text: 'Oui', handler: () => handleAskAnotherQuestion(question) },
+        { text: 'Non', handler: () => addBotMessage('D\'accord, au revoir! 👋') }
+    ]);
+}
+
 function askQuestion(question) {
     addUserMessage(question);
+    if (chatSocket && chatSocket.readyState === WebSocket.OPEN) {
+        chatSocket.lastQuestion = question;
+        chatSocket.send(JSON.stringify({ message: question }));
+        return;
+    }
+    sendQuestionRest(question);
+}
+
+function sendQuestionRest(question) {
     fetch('http://127.0.0.1:8000/api/chat', {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + token
         },
         body: JSON.stringify({ 
             message: question, 
@@ -198,17 +250,7 @@ function askQuestion(question) {
         })
     })
     .then(response => response.json())
-    .then(data => {
-        if (data.session_id) {
-            session_id = data.session_id;
-        }
-        addBotMessage(data.response);
-        addBotMessage('Vous avez besoin d\'autre chose ?');
-        addChoices([
-            { text: 'Oui', handler: () => handleAskAnotherQuestion(question) },
-            { text: 'Non', handler: () => addBotMessage('D\'accord, au revoir! 👋') }
-        ]);
-    })
+    .then(data => handleChatResponse(data, question))
     .catch(error => {
         console.error('Error:', error);
         addBotMessage('Une erreur s\'est produite. Veuillez réessayer plus tard.');
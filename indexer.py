@@ -1,8 +1,14 @@
 import faiss
 import numpy as np
 from transformers import AutoTokenizer, TFAutoModel
-from data_loader import qa_pairs
+from faq_loader import load_chatbot_data, CHATBOT_DATA_PATH
+from collections import OrderedDict
+import logging
 import os
+import re
+import threading
+import time
+import unicodedata
 
 # Charger le modèle de transformers
 tokenizer = AutoTokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
@@ -11,13 +17,53 @@ model = TFAutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
 INDEX_FILE_PATH = "faiss_index.bin"
 METADATA_FILE_PATH = "metadata.npy"
 
-def create_vector_db(qa_pairs, batch_size=32):
+# Index par créancier : sources Q&A dans SHARD_SOURCE_DIR, index pré-construits dans SHARD_DIR
+SHARD_SOURCE_DIR = "data/creanciers"
+SHARD_DIR = "shards"
+
+logger = logging.getLogger(__name__)
+
+def embed_texts(texts):
+    """
+    Calcule les embeddings (token CLS) d'une liste de textes.
+
+    Args:
+        texts (list): Textes à encoder.
+
+    Returns:
+        np.ndarray: Embeddings de forme (len(texts), dim).
+    """
+    inputs = tokenizer(texts, return_tensors="tf", padding=True, truncation=True)
+    outputs = model(**inputs)
+    return outputs.last_hidden_state[:, 0, :].numpy()
+
+def search_response_template(prompt, index, metadata):
+    """
+    Recherche le template de réponse le plus proche de l'entrée utilisateur.
+
+    Args:
+        prompt (str): Entrée utilisateur.
+        index (faiss.Index): Index à interroger.
+        metadata (list): Métadonnées associées à l'index.
+
+    Returns:
+        str or None: Template de réponse trouvé ou None.
+    """
+    user_input_embedding = embed_texts([prompt]).reshape(1, -1)
+    D, I = index.search(user_input_embedding, k=1)
+    if I[0][0] != -1:
+        return metadata[I[0][0]]['response']
+    return None
+
+def create_vector_db(qa_pairs, batch_size=32, index_path=INDEX_FILE_PATH, metadata_path=METADATA_FILE_PATH):
     """
     Crée une base de données vectorielle pour les paires de questions-réponses.
 
     Args:
         qa_pairs (list): Liste de paires de questions-réponses.
         batch_size (int, optional): Taille du batch pour l'embedding des questions. Par défaut 32.
+        index_path (str, optional): Chemin de sauvegarde de l'index FAISS.
+        metadata_path (str, optional): Chemin de sauvegarde des métadonnées.
 
     Returns:
         tuple: (index, metadata) où index est l'index FAISS et metadata est la liste des métadonnées.
@@ -28,10 +74,7 @@ def create_vector_db(qa_pairs, batch_size=32):
     for i in range(0, len(qa_pairs), batch_size):
         batch = qa_pairs[i:i+batch_size]
         batch_questions = [q[0] for q in batch]
-        inputs = tokenizer(batch_questions, return_tensors="tf", padding=True, truncation=True)
-        outputs = model(**inputs)
-        question_embeddings = outputs.last_hidden_state[:, 0, :].numpy()
-        embeddings.extend(question_embeddings)
+        embeddings.extend(embed_texts(batch_questions))
         for question, response in batch:
             metadata.append({'question': question, 'response': response})
    
@@ -40,8 +83,8 @@ def create_vector_db(qa_pairs, batch_size=32):
     index.add(embeddings)
    
     # Sauvegarder l'index et les metadata
-    faiss.write_index(index, INDEX_FILE_PATH)
-    np.save(METADATA_FILE_PATH, metadata)
+    faiss.write_index(index, index_path)
+    np.save(metadata_path, metadata)
    
     return index, metadata
 
@@ -57,7 +100,218 @@ def load_vector_db():
         metadata = np.load(METADATA_FILE_PATH, allow_pickle=True).tolist()
         return index, metadata
     else:
-        return create_vector_db(qa_pairs)
+        return create_vector_db(load_chatbot_data(CHATBOT_DATA_PATH))
+
+def shard_key(creditor):
+    """
+    Normalise un identifiant de créancier (code ou raison sociale) en nom de shard.
+
+    Args:
+        creditor (str): Code client ou raison sociale du créancier.
+
+    Returns:
+        str or None: Clé de shard utilisable comme nom de fichier, ou None si vide.
+    """
+    if creditor is None:
+        return None
+    text = unicodedata.normalize('NFKD', str(creditor)).encode('ascii', 'ignore').decode('ascii')
+    key = re.sub(r'[^a-z0-9]+', '_', text.strip().lower()).strip('_')
+    return key or None
+
+def shard_paths(key, shard_dir=SHARD_DIR):
+    """
+    Retourne les chemins de l'index et des métadonnées d'un shard.
+
+    Args:
+        key (str): Clé de shard (voir shard_key).
+        shard_dir (str, optional): Répertoire des shards pré-construits.
+
+    Returns:
+        tuple: (index_path, metadata_path).
+    """
+    return os.path.join(shard_dir, f"{key}.faiss"), os.path.join(shard_dir, f"{key}.npy")
+
+def build_shards(source_dir=SHARD_SOURCE_DIR, shard_dir=SHARD_DIR):
+    """
+    Construit un index FAISS par créancier à partir des fichiers Q&A de source_dir.
+
+    Chaque fichier `<creancier>.txt` suit le format de Data_Chatbot.txt.
+
+    Args:
+        source_dir (str, optional): Répertoire des fichiers Q&A par créancier.
+        shard_dir (str, optional): Répertoire de sortie des shards.
+
+    Returns:
+        list: Clés des shards construits.
+    """
+    if not os.path.isdir(source_dir):
+        logger.info(f"Répertoire {source_dir} introuvable, aucun shard à construire.")
+        return []
+    os.makedirs(shard_dir, exist_ok=True)
+    built = []
+    for file_name in sorted(os.listdir(source_dir)):
+        name, ext = os.path.splitext(file_name)
+        key = shard_key(name)
+        if ext != '.txt' or not key:
+            continue
+        pairs = load_chatbot_data(os.path.join(source_dir, file_name))
+        if not pairs:
+            logger.warning(f"Aucune paire question-réponse pour le créancier {name}, shard ignoré.")
+            continue
+        index_path, metadata_path = shard_paths(key, shard_dir)
+        create_vector_db(pairs, index_path=index_path, metadata_path=metadata_path)
+        built.append(key)
+        logger.info(f"Shard {key} construit ({len(pairs)} entrées).")
+    return built
+
+def load_shard(key, shard_dir=SHARD_DIR):
+    """
+    Charge un shard pré-construit depuis le disque.
+
+    Args:
+        key (str): Clé de shard.
+        shard_dir (str, optional): Répertoire des shards pré-construits.
+
+    Returns:
+        tuple or None: (index, metadata) ou None si le shard n'existe pas.
+    """
+    index_path, metadata_path = shard_paths(key, shard_dir)
+    if not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+        return None
+    index = faiss.read_index(index_path)
+    metadata = np.load(metadata_path, allow_pickle=True).tolist()
+    return index, metadata
+
+def shard_size(index, metadata):
+    """
+    Estime l'empreinte mémoire d'un shard en octets (vecteurs float32 et textes).
+    """
+    vectors = index.ntotal * index.d * 4
+    texts = sum(len(entry['question']) + len(entry['response']) for entry in metadata)
+    return vectors + texts
+
+class ShardCache:
+    """
+    Cache LRU des shards par créancier, borné en nombre et en mémoire.
+
+    Les shards sont chargés à la demande ; les moins récemment utilisés sont
+    évincés dès que max_shards ou max_bytes est dépassé. L'absence de shard pour
+    un créancier est mémorisée pendant missing_ttl secondes.
+
+    Attributes:
+        shards (OrderedDict): Shards chargés, du moins au plus récemment utilisé.
+        max_shards (int): Nombre maximal de shards en mémoire.
+        max_bytes (int): Taille mémoire maximale estimée des shards.
+        current_bytes (int): Taille mémoire estimée des shards chargés.
+        missing (dict): Date (time.monotonic) de la dernière recherche infructueuse par clé.
+    """
+
+    def __init__(self, max_shards=32, max_bytes=256 * 1024 * 1024, shard_dir=SHARD_DIR, loader=load_shard, missing_ttl=300):
+        """
+        Args:
+            max_shards (int, optional): Nombre maximal de shards. Par défaut 32.
+            max_bytes (int, optional): Mémoire maximale en octets. Par défaut 256 Mo.
+            shard_dir (str, optional): Répertoire des shards pré-construits.
+            loader (callable, optional): Fonction (key, shard_dir) -> (index, metadata) ou None.
+            missing_ttl (float, optional): Durée de mémorisation d'un shard absent en secondes. Par défaut 300.
+        """
+        self.shards = OrderedDict()
+        self.sizes = {}
+        self.missing = {}
+        self.missing_ttl = missing_ttl
+        self.max_shards = max_shards
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.shard_dir = shard_dir
+        self.loader = loader
+        # Partagé entre les threads de l'API : protège les shards et le compte d'octets
+        self.lock = threading.RLock()
+
+    def get(self, creditor):
+        """
+        Retourne le shard du créancier, en le chargeant si nécessaire.
+
+        Args:
+            creditor (str): Code client ou raison sociale du créancier.
+
+        Returns:
+            tuple or None: (index, metadata) ou None si aucun shard n'existe pour ce créancier.
+        """
+        key = shard_key(creditor)
+        if key is None:
+            return None
+        with self.lock:
+            missing_since = self.missing.get(key)
+            if missing_since is not None and time.monotonic() - missing_since < self.missing_ttl:
+                return None
+            if key in self.shards:
+                self.shards.move_to_end(key)
+                return self.shards[key]
+            shard = self.loader(key, self.shard_dir)
+            if shard is None:
+                self.missing[key] = time.monotonic()
+                return None
+            self.missing.pop(key, None)
+            self.shards[key] = shard
+            self.sizes[key] = shard_size(*shard)
+            self.current_bytes += self.sizes[key]
+            logger.info(f"Shard {key} chargé ({self.sizes[key]} octets).")
+            self.evict()
+            return shard
+
+    def evict(self):
+        """
+        Évince les shards les moins récemment utilisés au-delà des limites.
+
+        Le shard le plus récent est toujours conservé, même s'il dépasse max_bytes seul.
+        """
+        with self.lock:
+            while len(self.shards) > 1 and (len(self.shards) > self.max_shards or self.current_bytes > self.max_bytes):
+                oldest_key, _ = self.shards.popitem(last=False)
+                self.current_bytes -= self.sizes.pop(oldest_key)
+                logger.info(f"Shard {oldest_key} évincé du cache.")
+
+    def invalidate(self, creditor=None):
+        """
+        Oublie un shard (ou tous si creditor est None) pour qu'il soit relu depuis le disque.
+
+        Args:
+            creditor (str, optional): Code client ou raison sociale du créancier.
+        """
+        with self.lock:
+            keys = list(self.shards) + list(self.missing) if creditor is None else [shard_key(creditor)]
+            for key in keys:
+                self.missing.pop(key, None)
+                if key in self.shards:
+                    del self.shards[key]
+                    self.current_bytes -= self.sizes.pop(key)
+
+def select_shard(shard_cache, user, default_index, default_metadata):
+    """
+    Sélectionne l'index et les métadonnées du créancier d'un débiteur.
+
+    Le shard est recherché par code client puis par raison sociale ; à défaut,
+    l'index par défaut est utilisé.
+
+    Args:
+        shard_cache (ShardCache or None): Cache des shards, None pour l'index unique.
+        user (dict): Données du débiteur (au moins code_client et/ou raison_sociale_client).
+        default_index (faiss.Index): Index global.
+        default_metadata (list): Métadonnées de l'index global.
+
+    Returns:
+        tuple: (index, metadata) à utiliser pour la recherche.
+    """
+    if shard_cache is not None:
+        for creditor in (user.get('code_client'), user.get('raison_sociale_client')):
+            shard = shard_cache.get(creditor)
+            if shard is not None:
+                return shard
+    return default_index, default_metadata
 
 # Charger ou créer l'index et les metadata
 vector_db, metadata = load_vector_db()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Shards construits : {build_shards()}")
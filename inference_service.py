@@ -0,0 +1,289 @@
+"""
+Service d'inférence multi-processus pour le chatbot CAP Recouvrement.
+
+Un pool fixe de processus encodeurs (modèle, index et shards chargés une fois
+par processus) répond aux requêtes d'embedding et de recherche sur un socket
+Unix. Les processus de l'API, lancés avec la variable d'environnement
+INFERENCE_SOCKET, ne chargent alors ni le modèle ni l'index et délèguent la
+recherche via InferenceClient.
+
+Lancement:
+    python inference_service.py --socket /tmp/cap_inference.sock --workers 4 --intra-op-threads 1
+    INFERENCE_SOCKET=/tmp/cap_inference.sock uvicorn main:app
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import struct
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/cap_inference.sock"
+HEADER = struct.Struct("!I")
+
+# Un processus encodeur qui s'arrête moins de RESTART_WINDOW_SECONDS après son démarrage
+# est relancé après un délai doublant à chaque échec, jusqu'à MAX_RESTART_DELAY_SECONDS
+RESTART_WINDOW_SECONDS = 30
+MAX_RESTART_DELAY_SECONDS = 60
+
+# Délai maximal d'attente d'un client sur une connexion acceptée par un processus encodeur
+CONNECTION_TIMEOUT_SECONDS = 30
+
+def available_cores():
+    """
+    Retourne le nombre de cœurs utilisables par ce processus.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def send_message(sock, payload):
+    """
+    Envoie un message JSON préfixé par sa longueur sur 4 octets.
+    """
+    data = json.dumps(payload).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def recv_exact(sock, size):
+    """
+    Lit exactement size octets sur le socket.
+    """
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError("Connexion fermée par le service d'inférence.")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+def recv_message(sock):
+    """
+    Reçoit un message JSON préfixé par sa longueur sur 4 octets.
+    """
+    (size,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return json.loads(recv_exact(sock, size).decode('utf-8'))
+
+class InferenceClient:
+    """
+    Client du service d'inférence, utilisé par les processus de l'API.
+
+    Chaque requête ouvre une connexion courte sur le socket Unix, ce qui laisse
+    le noyau répartir les requêtes entre les processus encodeurs disponibles.
+
+    Attributes:
+        socket_path (str): Chemin du socket Unix du service.
+        timeout (float): Délai maximal d'une requête en secondes.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, payload):
+        """
+        Envoie une requête au service et retourne sa réponse.
+
+        Raises:
+            RuntimeError: Si le service signale une erreur.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            send_message(sock, payload)
+            response = recv_message(sock)
+        if "error" in response:
+            raise RuntimeError(f"Erreur du service d'inférence: {response['error']}")
+        return response
+
+    def embed(self, texts):
+        """
+        Calcule les embeddings (token CLS) d'une liste de textes.
+        """
+        return self.request({"op": "embed", "texts": list(texts)})["embeddings"]
+
+    def find_response_template(self, prompt, user):
+        """
+        Recherche le template de réponse dans l'index du créancier du débiteur.
+
+        Args:
+            prompt (str): Entrée utilisateur.
+            user (dict): Données du débiteur (seuls les identifiants du créancier sont transmis).
+
+        Returns:
+            str or None: Template de réponse trouvé ou None.
+        """
+        creditor = {key: str(user[key]) for key in ("code_client", "raison_sociale_client") if user.get(key) is not None}
+        return self.request({"op": "search", "prompt": prompt, "user": creditor})["template"]
+
+class LocalEncoder:
+    """
+    Encodeur d'un processus du pool : modèle, index global et shards d'indexer.
+
+    Les données des débiteurs ne sont pas chargées, seule la recherche de
+    templates est servie ici.
+    """
+
+    def __init__(self):
+        import indexer
+        self.indexer = indexer
+        self.shard_cache = indexer.ShardCache()
+
+    def search(self, prompt, user):
+        index, metadata = self.indexer.select_shard(self.shard_cache, user, self.indexer.vector_db, self.indexer.metadata)
+        return self.indexer.search_response_template(prompt, index, metadata)
+
+    def embed(self, texts):
+        return self.indexer.embed_texts(texts).tolist()
+
+def handle_request(request, encoder):
+    """
+    Traite une requête d'inférence décodée.
+
+    Args:
+        request (dict): Requête `{"op": "search" | "embed", ...}`.
+        encoder: Objet exposant search(prompt, user) et embed(texts).
+
+    Returns:
+        dict: Réponse à renvoyer au client.
+
+    Raises:
+        ValueError: Si la requête est invalide.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("La requête doit être un objet JSON.")
+    op = request.get("op")
+    if op == "search":
+        return {"template": encoder.search(request["prompt"], request.get("user") or {})}
+    if op == "embed":
+        return {"embeddings": encoder.embed(list(request["texts"]))}
+    raise ValueError(f"Opération inconnue: {op}")
+
+def serve_connection(conn, encoder, timeout=CONNECTION_TIMEOUT_SECONDS):
+    """
+    Traite la requête d'une connexion ; aucune erreur n'est propagée au processus encodeur.
+
+    Un client qui n'envoie pas sa requête (ou ne lit pas la réponse) dans le délai
+    timeout est abandonné, pour ne pas bloquer le processus encodeur.
+    """
+    conn.settimeout(timeout)
+    try:
+        request = recv_message(conn)
+    except (ConnectionError, OSError, ValueError, struct.error) as e:
+        # ValueError couvre les trames JSON ou UTF-8 invalides
+        logger.warning(f"Requête d'inférence illisible: {e}")
+        return
+    try:
+        response = handle_request(request, encoder)
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement de la requête d'inférence: {e}")
+        response = {"error": str(e)}
+    try:
+        send_message(conn, response)
+    except (ConnectionError, OSError) as e:
+        logger.warning(f"Connexion d'inférence interrompue: {e}")
+
+def worker_main(listener, intra_op_threads):
+    """
+    Boucle d'un processus encodeur : charge le modèle puis traite les requêtes.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    encoder = LocalEncoder()
+
+    logger.info(f"Processus encodeur {os.getpid()} prêt ({intra_op_threads} thread(s) intra-op).")
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            serve_connection(conn, encoder)
+
+def restart_delay(failures):
+    """
+    Délai avant de relancer un processus encodeur après failures arrêts rapprochés.
+    """
+    return 0 if failures == 0 else min(MAX_RESTART_DELAY_SECONDS, 2 ** (failures - 1))
+
+def stop_service(signum, frame):
+    """
+    Convertit SIGTERM en KeyboardInterrupt pour arrêter proprement le superviseur.
+    """
+    raise KeyboardInterrupt
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, workers=None, intra_op_threads=None):
+    """
+    Démarre le pool de processus encodeurs sur le socket Unix et le supervise.
+
+    Par défaut, un processus par cœur disponible avec un thread intra-op chacun ;
+    un processus mort est relancé, avec un délai croissant s'il s'arrête peu après
+    son démarrage (voir restart_delay).
+
+    Args:
+        socket_path (str, optional): Chemin du socket Unix.
+        workers (int, optional): Nombre de processus encodeurs.
+        intra_op_threads (int, optional): Threads intra-op TensorFlow par processus.
+    """
+    cores = available_cores()
+    workers = workers or cores
+    intra_op_threads = intra_op_threads or max(1, cores // workers)
+    if workers * intra_op_threads > cores:
+        logger.warning(f"{workers} processus x {intra_op_threads} threads dépassent les {cores} cœurs disponibles.")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+
+    context = multiprocessing.get_context("fork")
+
+    def start_worker():
+        process = context.Process(target=worker_main, args=(listener, intra_op_threads), daemon=True)
+        process.start()
+        return process
+
+    processes = [start_worker() for _ in range(workers)]
+    started_at = [time.monotonic()] * workers
+    failures = [0] * workers
+    logger.info(f"Service d'inférence démarré sur {socket_path} avec {workers} processus.")
+    signal.signal(signal.SIGTERM, stop_service)
+    try:
+        while True:
+            multiprocessing.connection.wait([process.sentinel for process in processes])
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    if time.monotonic() - started_at[i] < RESTART_WINDOW_SECONDS:
+                        failures[i] += 1
+                    else:
+                        failures[i] = 0
+                    delay = restart_delay(failures[i])
+                    logger.warning(f"Processus encodeur {process.pid} arrêté (code {process.exitcode}), redémarrage dans {delay} s.")
+                    time.sleep(delay)
+                    processes[i] = start_worker()
+                    started_at[i] = time.monotonic()
+    except KeyboardInterrupt:
+        logger.info("Arrêt du service d'inférence.")
+    finally:
+        for process in processes:
+            process.terminate()
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service d'inférence multi-processus du chatbot.")
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET", DEFAULT_SOCKET_PATH))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFERENCE_WORKERS", "0")) or None)
+    parser.add_argument("--intra-op-threads", type=int, default=int(os.getenv("INFERENCE_INTRA_OP_THREADS", "0")) or None)
+    args = parser.parse_args()
+    serve(args.socket, args.workers, args.intra_op_threads)
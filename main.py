@@ -1,17 +1,23 @@
+import asyncio
+import functools
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional
 from uuid import uuid4
-from chatbot import cap_chatbot
+from chatbot import cap_chatbot, INFERENCE_SOCKET
 from data_loader import debtor_data, encrypt_data, decrypt_data
+from session_cache import SessionNearCache
 import redis
 import json
 import jwt
 from datetime import datetime, timedelta
 import os
+import time
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement depuis un fichier .env
@@ -26,6 +32,22 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("La clé secrète JWT n'est pas définie. Veuillez la définir dans la variable d'environnement 'SECRET_KEY'.")
 
+# Écriture différée des sessions WebSocket : délai d'inactivité et nombre de tours avant sauvegarde
+WS_FLUSH_IDLE_SECONDS = float(os.getenv("WS_FLUSH_IDLE_SECONDS", "5"))
+WS_FLUSH_MAX_PENDING = int(os.getenv("WS_FLUSH_MAX_PENDING", "10"))
+# Threads d'inférence TF locale (sans service d'inférence) : limités pour ne pas surcharger le CPU
+LOCAL_INFERENCE_THREADS = int(os.getenv("LOCAL_INFERENCE_THREADS", "1"))
+
+# Délai accordé au client WebSocket pour envoyer son message d'authentification
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+
+# Cache local des sessions (désactivé par défaut) : nombre et taille maximale des entrées
+SESSION_NEAR_CACHE = os.getenv("SESSION_NEAR_CACHE", "0") == "1"
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1000"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Tentatives d'ajout à l'historique lorsque la session est modifiée en parallèle
+SESSION_WRITE_ATTEMPTS = int(os.getenv("SESSION_WRITE_ATTEMPTS", "3"))
+
 app = FastAPI()
 
 # Définir le schéma de sécurité avec HTTPBearer
@@ -49,32 +71,160 @@ except redis.ConnectionError:
     logger.error("Impossible de se connecter à Redis.")
     raise HTTPException(status_code=500, detail="Impossible de se connecter à Redis.")
 
+session_cache = SessionNearCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_MAX_BYTES) if SESSION_NEAR_CACHE else None
+
+# Écrit une session seulement si sa version dans Redis est encore celle lue avec elle
+# (ARGV[1], vide si la session n'avait pas de version), puis incrémente la version
+save_session_script = redis_client.register_script("""
+local current = redis.call('GET', KEYS[2]) or ''
+if current ~= ARGV[1] then
+    return {0}
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+local version = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {1, version}
+""")
+
+def session_version_key(session_id: str):
+    """
+    Clé Redis du numéro de version d'une session, incrémenté à chaque sauvegarde.
+    """
+    return f"{session_id}:version"
+
+def empty_session():
+    """
+    Session retournée lorsqu'elle est absente de Redis ou illisible.
+    """
+    return {"history": [], "user_verified": False, "first_name": "", "last_name": "", "code_client": ""}
+
+def read_session(session_id: str):
+    """
+    Récupère une session déchiffrée et sa version.
+
+    Si le cache local est activé, une session en cache est servie sans accès à
+    Redis : sa version est vérifiée à l'écriture suivante (voir write_session).
+
+    Returns:
+        tuple: (données de session, version ou None si la session n'en a pas).
+    """
+    if session_cache is not None:
+        cached = session_cache.get(session_id)
+        if cached is not None:
+            return cached, session_cache.version(session_id)
+    # Données et version lues dans un même aller-retour
+    pipeline = redis_client.pipeline()
+    pipeline.get(session_id)
+    pipeline.get(session_version_key(session_id))
+    session_data, version = pipeline.execute()
+    if not session_data:
+        return empty_session(), version
+    try:
+        decrypted = decrypt_data(session_data)
+    except Exception as e:
+        logger.error(f"Erreur lors du déchiffrement des données de session : {e}")
+        return empty_session(), version
+    if session_cache is not None and version is not None:
+        session_cache.put(session_id, version, decrypted)
+    return decrypted, version
+
 def get_session(session_id: str):
     """
     Récupère les données de session depuis Redis, déchiffrées.
     """
-    session_data = redis_client.get(session_id)
-    if session_data:
-        try:
-            return decrypt_data(session_data)
-        except Exception as e:
-            logger.error(f"Erreur lors du déchiffrement des données de session : {e}")
-            return {"history": [], "user_verified": False, "first_name": "", "last_name": "", "code_client": ""}
-    else:
-        return {"history": [], "user_verified": False, "first_name": "", "last_name": "", "code_client": ""}
+    return read_session(session_id)[0]
 
 def save_session(session_id: str, session_data: dict, expiration=3600):
     """
-    Enregistre les données de session chiffrées dans Redis.
+    Enregistre les données de session chiffrées dans Redis, sans vérifier leur version.
     """
     try:
         encrypted_data = encrypt_data(session_data)
-        redis_client.set(session_id, encrypted_data, ex=expiration)
+        # Écrire la session et incrémenter sa version dans une même transaction
+        pipeline = redis_client.pipeline()
+        pipeline.set(session_id, encrypted_data, ex=expiration)
+        pipeline.incr(session_version_key(session_id))
+        pipeline.expire(session_version_key(session_id), expiration)
+        _, version, _ = pipeline.execute()
+        if session_cache is not None:
+            session_cache.put(session_id, version, session_data)
         logger.info(f"Session {session_id} sauvegardée avec expiration de {expiration} secondes.")
     except Exception as e:
         logger.error(f"Erreur lors de la sauvegarde de la session {session_id} : {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde de la session.")
 
+def write_session(session_id: str, session_data: dict, version, expiration=3600):
+    """
+    Enregistre une session si elle n'a pas été modifiée depuis sa lecture (compare-and-set).
+
+    Args:
+        session_id (str): Identifiant de la session.
+        session_data (dict): Données de session à enregistrer.
+        version (str or None): Version lue avec la session (voir read_session).
+        expiration (int, optional): Durée de vie en secondes. Par défaut 3600.
+
+    Returns:
+        int or None: La nouvelle version, ou None si la session a changé dans Redis.
+    """
+    reply = save_session_script(
+        keys=[session_id, session_version_key(session_id)],
+        args=[version if version is not None else "", encrypt_data(session_data), expiration],
+    )
+    if not reply[0]:
+        logger.info(f"Session {session_id} modifiée depuis sa lecture (version {version}).")
+        if session_cache is not None:
+            session_cache.mark_stale(session_id)
+        return None
+    new_version = reply[1]
+    if session_cache is not None:
+        session_cache.put(session_id, new_version, session_data)
+    return new_version
+
+def append_history(session_id: str, turns: list, session_data: dict = None, version=None, expiration=3600):
+    """
+    Ajoute des tours à l'historique d'une session sans écraser une écriture concurrente.
+
+    En cas de conflit (voir write_session), la session est relue et les tours
+    sont ajoutés à sa nouvelle version, jusqu'à SESSION_WRITE_ATTEMPTS tentatives.
+
+    Args:
+        session_id (str): Identifiant de la session.
+        turns (list): Tours `{"user": ..., "bot": ...}` à ajouter.
+        session_data (dict, optional): Session déjà lue, relue dans Redis si absente.
+        version (str, optional): Version lue avec session_data.
+        expiration (int, optional): Durée de vie en secondes. Par défaut 3600.
+
+    Returns:
+        tuple: (session enregistrée, nouvelle version).
+    """
+    try:
+        for _ in range(SESSION_WRITE_ATTEMPTS):
+            if session_data is None:
+                session_data, version = read_session(session_id)
+            updated = {**session_data, "history": session_data["history"] + list(turns)}
+            new_version = write_session(session_id, updated, version, expiration)
+            if new_version is not None:
+                logger.info(f"Session {session_id} sauvegardée avec expiration de {expiration} secondes.")
+                return updated, new_version
+            session_data = None
+    except Exception as e:
+        logger.error(f"Erreur lors de la sauvegarde de la session {session_id} : {e}")
+        raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde de la session.")
+    logger.error(f"Session {session_id} modifiée en parallèle à chaque tentative de sauvegarde.")
+    raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde de la session.")
+
+# En mode local, l'inférence passe par un exécuteur dédié de taille fixe ;
+# avec le service d'inférence, les threads de l'API ne font qu'attendre l'IPC
+inference_executor = None if INFERENCE_SOCKET else ThreadPoolExecutor(max_workers=LOCAL_INFERENCE_THREADS)
+
+async def run_chatbot(func, *args):
+    """
+    Exécute un appel du chatbot hors de la boucle d'événements.
+    """
+    if inference_executor is None:
+        return await run_in_threadpool(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, functools.partial(func, *args))
+
 def create_jwt_token(user_data):
     """
     Génère un JWT pour l'authentification de l'utilisateur.
@@ -91,15 +241,14 @@ def create_jwt_token(user_data):
         logger.error(f"Erreur lors de la génération du jeton JWT : {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de la génération du jeton.")
 
-def decode_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token_payload(token: str):
     """
-    Décode un JWT pour vérifier l'utilisateur.
+    Décode un JWT et retourne son contenu complet (données utilisateur et expiration).
     """
-    token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         logger.info("Jeton JWT décodé avec succès.")
-        return payload["user"]
+        return payload
     except jwt.ExpiredSignatureError:
         logger.warning("Le jeton JWT a expiré.")
         raise HTTPException(status_code=401, detail="Le token a expiré")
@@ -107,6 +256,72 @@ def decode_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(securit
         logger.warning("Jeton JWT invalide.")
         raise HTTPException(status_code=401, detail="Token invalide")
 
+def decode_token(token: str):
+    """
+    Décode un JWT et retourne les données utilisateur qu'il contient.
+    """
+    return decode_token_payload(token)["user"]
+
+def decode_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Décode un JWT pour vérifier l'utilisateur.
+    """
+    return decode_token(credentials.credentials)
+
+def find_debtor(first_name: str, last_name: str, code_client: str):
+    """
+    Recherche un débiteur par prénom, nom et code client.
+
+    Returns:
+        dict or None: Les données du débiteur si trouvées, sinon None.
+    """
+    user = debtor_data[
+        (debtor_data['prenom_debiteur'].str.lower() == first_name.lower()) &
+        (debtor_data['nom_debiteur'].str.lower() == last_name.lower()) &
+        (debtor_data['code_client'].astype(str) == str(code_client))
+    ]
+    return user.to_dict('records')[0] if not user.empty else None
+
+class SessionWriter:
+    """
+    Écriture différée (write-behind) d'une session WebSocket dans Redis.
+
+    Les tours de conversation sont accumulés en mémoire et sauvegardés ensemble
+    après WS_FLUSH_MAX_PENDING tours, après WS_FLUSH_IDLE_SECONDS d'inactivité
+    ou à la déconnexion.
+
+    Attributes:
+        session_data (dict): Dernière version connue de la session.
+        version (str or None): Version de session_data dans Redis.
+        pending (list): Tours pas encore sauvegardés.
+    """
+
+    def __init__(self, session_id: str, session_data: dict, version=None, max_pending: int = WS_FLUSH_MAX_PENDING):
+        self.session_id = session_id
+        self.session_data = session_data
+        self.version = version
+        self.max_pending = max_pending
+        self.pending = []
+
+    def append(self, user_message: str, bot_response: str):
+        """
+        Ajoute un tour en attente et indique si une sauvegarde est due.
+        """
+        self.pending.append({"user": user_message, "bot": bot_response})
+        return len(self.pending) >= self.max_pending
+
+    def flush(self):
+        """
+        Sauvegarde les tours en attente.
+
+        Les tours en attente sont ajoutés à la dernière version de la session
+        (voir append_history), pour ne pas écraser les tours enregistrés entre
+        temps par /api/chat sur la même session.
+        """
+        if self.pending:
+            self.session_data, self.version = append_history(self.session_id, self.pending, self.session_data, self.version)
+            self.pending = []
+
 # Définir les modèles Pydantic
 class Message(BaseModel):
     message: str
@@ -117,6 +332,15 @@ class UserVerification(BaseModel):
     last_name: str
     code_client: str
 
+@app.get("/api/session_cache/stats")
+async def session_cache_stats():
+    """
+    Retourne les compteurs du cache local des sessions (succès, échecs, entrées périmées).
+    """
+    if session_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **session_cache.stats()}
+
 @app.post("/api/verify_user")
 async def verify_user(user: UserVerification):
     """
@@ -167,7 +391,7 @@ async def chat(message: Message, user_data: dict = Depends(decode_jwt_token)):
     """
     try:
         logger.info(f"Message reçu: {message.message} | Session ID: {message.session_id}")
-        session_data = get_session(message.session_id)
+        session_data, version = read_session(message.session_id)
         logger.info(f"Données de session récupérées: {session_data}")
 
         if session_data and session_data.get("user_verified"):
@@ -176,22 +400,17 @@ async def chat(message: Message, user_data: dict = Depends(decode_jwt_token)):
             code_client = user_data.get("code_client")
 
             # Vérifier que les données utilisateur correspondent
-            user = debtor_data[
-                (debtor_data['prenom_debiteur'].str.lower() == first_name.lower()) &
-                (debtor_data['nom_debiteur'].str.lower() == last_name.lower()) &
-                (debtor_data['code_client'].astype(str) == str(code_client))
-            ]
+            user = find_debtor(first_name, last_name, code_client)
 
-            logger.info(f"Utilisateur trouvé dans la base de données: {not user.empty}")
+            logger.info(f"Utilisateur trouvé dans la base de données: {user is not None}")
 
-            if not user.empty:
+            if user is not None:
                 # Appel corrigé à get_response avec le bon nombre d'arguments
-                response = cap_chatbot.get_response(
-                    message.message, first_name, last_name, code_client, message.session_id
+                response = await run_chatbot(
+                    cap_chatbot.get_response, message.message, first_name, last_name, code_client, message.session_id
                 )
                 # Mettre à jour l'historique de la session
-                session_data["history"].append({"user": message.message, "bot": response})
-                save_session(message.session_id, session_data)
+                append_history(message.session_id, [{"user": message.message, "bot": response}], session_data, version)
                 logger.info(f"Réponse du chatbot: {response}")
                 return {"response": response, "session_id": message.session_id}
             else:
@@ -206,3 +425,103 @@ async def chat(message: Message, user_data: dict = Depends(decode_jwt_token)):
     except Exception as e:
         logger.error(f"Erreur dans /api/chat: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Une erreur est survenue.")
+
+def parse_ws_message(text: str):
+    """
+    Décode un message WebSocket JSON.
+
+    Returns:
+        dict or None: Le message s'il s'agit d'un objet JSON, sinon None.
+    """
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def session_matches_user(session_data: dict, user_data: dict):
+    """
+    Vérifie que la session a été ouverte par l'utilisateur du jeton.
+    """
+    return all(
+        str(session_data.get(field, "")).lower() == str(user_data.get(field, "")).lower()
+        for field in ("first_name", "last_name", "code_client")
+    )
+
+async def authenticate_ws(websocket: WebSocket):
+    """
+    Authentifie une connexion WebSocket à partir de son premier message
+    `{"token": ..., "session_id": ...}`, pour que le jeton n'apparaisse pas dans l'URL.
+
+    Returns:
+        tuple or None: (session_id, session_data, version, debtor, expiration) ou None si refusé.
+    """
+    try:
+        auth = parse_ws_message(await asyncio.wait_for(websocket.receive_text(), timeout=WS_AUTH_TIMEOUT_SECONDS))
+    except asyncio.TimeoutError:
+        auth = None
+    if not auth or not isinstance(auth.get("token"), str) or not isinstance(auth.get("session_id"), str):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Authentification requise")
+        return None
+    try:
+        payload = decode_token_payload(auth["token"])
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return None
+
+    user_data = payload["user"]
+    session_id = auth["session_id"]
+    session_data, version = read_session(session_id)
+    user = None
+    if session_data.get("user_verified") and session_matches_user(session_data, user_data):
+        user = find_debtor(user_data.get("first_name"), user_data.get("last_name"), user_data.get("code_client"))
+    if user is None:
+        logger.warning("Connexion WebSocket refusée : session invalide ou utilisateur non vérifié.")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Utilisateur non vérifié ou session invalide")
+        return None
+    return session_id, session_data, version, user, payload["exp"]
+
+@app.websocket("/ws/chat")
+async def chat_ws(websocket: WebSocket):
+    """
+    Conversation via WebSocket : le premier message authentifie la connexion
+    (voir authenticate_ws), la session et le débiteur sont ensuite conservés pour
+    toute la durée de la connexion, tant que le jeton n'a pas expiré.
+    L'historique est sauvegardé dans Redis en écriture différée (voir SessionWriter).
+    """
+    await websocket.accept()
+    try:
+        auth = await authenticate_ws(websocket)
+    except WebSocketDisconnect:
+        return
+    if auth is None:
+        return
+    session_id, session_data, version, user, expiration = auth
+    writer = SessionWriter(session_id, session_data, version)
+    logger.info(f"Connexion WebSocket ouverte | Session ID: {session_id}")
+    try:
+        while True:
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=WS_FLUSH_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                writer.flush()
+                text = await websocket.receive_text()
+            if time.time() >= expiration:
+                logger.warning(f"Jeton expiré sur la connexion WebSocket | Session ID: {session_id}")
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Le token a expiré")
+                break
+            payload = parse_ws_message(text)
+            message = str(payload.get("message", "")).strip() if payload else ""
+            if not message:
+                continue
+            response = await run_chatbot(cap_chatbot.respond, message, user)
+            await websocket.send_json({"response": response, "session_id": session_id})
+            if writer.append(message, response):
+                writer.flush()
+    except WebSocketDisconnect:
+        logger.info(f"Connexion WebSocket fermée | Session ID: {session_id}")
+    except Exception as e:
+        logger.error(f"Erreur dans /ws/chat: {e}", exc_info=True)
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        writer.flush()
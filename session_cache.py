@@ -0,0 +1,105 @@
+import json
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class SessionNearCache:
+    """
+    Cache local (near-cache) des sessions déchiffrées, devant Redis.
+
+    Les sessions en cache sont servies sans accès à Redis. Chaque entrée garde le
+    numéro de version de la session lue ; il accompagne l'écriture suivante, que
+    Redis refuse si un autre worker a modifié la session entre temps. L'entrée
+    est alors marquée périmée (voir mark_stale) et la session relue.
+
+    Attributes:
+        entries (OrderedDict): Sessions en cache (version, JSON), du moins au plus récemment utilisé.
+        max_entries (int): Nombre maximal de sessions en cache.
+        max_bytes (int): Taille maximale cumulée des sessions sérialisées.
+        current_bytes (int): Taille cumulée actuelle des sessions sérialisées.
+        hits (int): Lectures servies par le cache.
+        misses (int): Lectures de sessions absentes du cache.
+        stale (int): Entrées écartées car la session a été modifiée dans Redis depuis.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int, optional): Nombre maximal de sessions. Par défaut 1000.
+            max_bytes (int, optional): Taille maximale en octets. Par défaut 16 Mo.
+        """
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def version(self, session_id):
+        """
+        Retourne la version en cache d'une session, ou None si elle est absente.
+        """
+        entry = self.entries.get(session_id)
+        return entry[0] if entry else None
+
+    def get(self, session_id):
+        """
+        Retourne la session en cache.
+
+        Args:
+            session_id (str): Identifiant de la session.
+
+        Returns:
+            dict or None: Copie des données de session, ou None si absente.
+        """
+        entry = self.entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(session_id)
+        return json.loads(entry[1])
+
+    def put(self, session_id, version, session_data):
+        """
+        Enregistre une session et sa version, en évinçant les plus anciennes si nécessaire.
+        """
+        self.invalidate(session_id)
+        payload = json.dumps(session_data)
+        if len(payload) > self.max_bytes:
+            logger.info(f"Session {session_id} trop volumineuse pour le cache local.")
+            return
+        self.entries[session_id] = (str(version), payload)
+        self.current_bytes += len(payload)
+        while len(self.entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+    def invalidate(self, session_id):
+        """
+        Retire une session du cache.
+        """
+        entry = self.entries.pop(session_id, None)
+        if entry is not None:
+            self.current_bytes -= len(entry[1])
+
+    def mark_stale(self, session_id):
+        """
+        Retire une session dont la version en cache n'est plus celle de Redis.
+        """
+        self.stale += 1
+        self.invalidate(session_id)
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+        }
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from benchmark_retrieval import evaluate, language_accuracy, load_eval_set
+
+# Vecteurs des textes connus de l'encodeur factice ; les autres textes sont encodés à zéro
+VECTORS = {
+    "Puis-je payer en plusieurs fois ?": [1.0, 0.0],
+    "Bonjour": [0.0, 1.0],
+    "Je peux payer en plusieurs fois ?": [0.9, 0.1],
+    "Can I pay in instalments?": [0.8, 0.2],
+}
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = np.asarray(array, dtype='float32')
+
+    def numpy(self):
+        return self.array
+
+class FakeTokenizer:
+    def __call__(self, texts, **kwargs):
+        return {"texts": list(texts), "attention_mask": FakeTensor(np.ones((len(texts), 1)))}
+
+class FakeModel:
+    weights = [SimpleNamespace(shape=(2, 2), dtype=np.dtype('float32'))]
+
+    def __call__(self, texts, attention_mask):
+        hidden = [[VECTORS.get(text, [0.0, 0.0])] for text in texts]
+        return SimpleNamespace(last_hidden_state=FakeTensor(hidden))
+
+class TestLoadEvalSet(unittest.TestCase):
+
+    def write(self, content):
+        file = tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False)
+        file.write(content)
+        file.close()
+        self.addCleanup(os.unlink, file.name)
+        return file.name
+
+    def test_parses_lines(self):
+        path = self.write("# commentaire\nfr::Je peux payer ?::\ufeffPuis-je payer ? \n\nen::Can I pay?::Puis-je payer ?\n")
+        self.assertEqual(load_eval_set(path), [
+            ("fr", "Je peux payer ?", "Puis-je payer ?"),
+            ("en", "Can I pay?", "Puis-je payer ?"),
+        ])
+
+    def test_rejects_malformed_line(self):
+        path = self.write("fr::Je peux payer ?\n")
+        with self.assertRaises(ValueError):
+            load_eval_set(path)
+
+class TestEvaluate(unittest.TestCase):
+
+    def setUp(self):
+        self.qa_pairs = [
+            ["Puis-je payer en plusieurs fois ?", "Oui, par échéancier."],
+            ["Bonjour", "Bonjour, que puis-je faire pour vous ?"],
+            ["Puis-je payer en plusieurs fois ?", "Contactez votre conseiller."],
+        ]
+
+    def run_evaluate(self, eval_set):
+        return evaluate(FakeTokenizer(), FakeModel(), self.qa_pairs, eval_set, 'cls', 'flat_l2', 2)
+
+    def test_duplicate_questions_accept_any_response(self):
+        row = self.run_evaluate([
+            ("fr", "Je peux payer en plusieurs fois ?", "Puis-je payer en plusieurs fois ?"),
+            ("en", "Can I pay in instalments?", "Puis-je payer en plusieurs fois ?"),
+        ])
+        self.assertEqual(row['top1'], 1.0)
+        self.assertEqual(row['topk'], 1.0)
+        self.assertEqual(row['top1_fr'], 1.0)
+        self.assertEqual(row['top1_en'], 1.0)
+        self.assertEqual(row['model_bytes'], 16)
+
+    def test_missing_language_is_blank(self):
+        row = self.run_evaluate([("fr", "Je peux payer en plusieurs fois ?", "Puis-je payer en plusieurs fois ?")])
+        self.assertEqual(row['top1_en'], '')
+
+    def test_unknown_expected_question(self):
+        with self.assertRaises(ValueError):
+            self.run_evaluate([("fr", "Je peux payer en plusieurs fois ?", "Question inconnue")])
+
+class TestLanguageAccuracy(unittest.TestCase):
+
+    def test_accuracy(self):
+        self.assertEqual(language_accuracy({"fr": [True, False, True, True]}, "fr"), 0.75)
+
+    def test_absent_language(self):
+        self.assertEqual(language_accuracy({"fr": [True]}, "en"), '')
+        self.assertEqual(language_accuracy({"en": []}, "en"), '')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,8 @@
+import threading
 import unittest
 from chatbot import CAPRecouvrementChatBot, verify_user
 from data_loader import debtor_data
-from indexer import vector_db, metadata
+from indexer import vector_db, metadata, ShardCache, shard_key, build_shards
 
 class TestChatBot(unittest.TestCase):
    
@@ -35,5 +36,74 @@ class TestChatBot(unittest.TestCase):
             self.chatbot.get_response(f"Question {i}", "first_name", "last_name", str(i), debtor_data)
         self.assertEqual(len(self.chatbot.memory), 100)  # Limite fixée à 100
 
+class FakeIndex:
+    def __init__(self, ntotal, d=384):
+        self.ntotal = ntotal
+        self.d = d
+
+class TestShardCache(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        def loader(key, shard_dir):
+            self.loaded.append(key)
+            if key == 'inconnu':
+                return None
+            return FakeIndex(10), [{'question': key, 'response': key}]
+        self.cache = ShardCache(max_shards=2, loader=loader)
+
+    def test_shard_key(self):
+        self.assertEqual(shard_key("SARL EUREKA GYM CENTER"), "sarl_eureka_gym_center")
+        self.assertEqual(shard_key(1007), "1007")
+        self.assertIsNone(shard_key("  "))
+
+    def test_lazy_load_and_lru_eviction(self):
+        self.cache.get("1007")
+        self.cache.get("1009")
+        self.cache.get("1007")
+        self.cache.get("1010")
+        self.assertEqual(list(self.cache.shards), ["1007", "1010"])
+        self.assertEqual(self.loaded, ["1007", "1009", "1010"])
+
+    def test_memory_bound(self):
+        size = 10 * 384 * 4 + 8
+        self.cache.max_bytes = size * 2 - 1
+        self.cache.get("1007")
+        self.cache.get("1009")
+        self.assertEqual(list(self.cache.shards), ["1009"])
+        self.assertEqual(self.cache.current_bytes, size)
+
+    def test_missing_shard(self):
+        self.assertIsNone(self.cache.get("inconnu"))
+        self.assertIsNone(self.cache.get("inconnu"))
+        self.assertEqual(self.loaded, ["inconnu"])
+
+    def test_missing_shard_expires(self):
+        self.cache.get("inconnu")
+        self.cache.missing["inconnu"] -= self.cache.missing_ttl + 1
+        self.cache.get("inconnu")
+        self.assertEqual(self.loaded, ["inconnu", "inconnu"])
+
+    def test_invalidate(self):
+        self.cache.get("inconnu")
+        self.cache.get("1007")
+        self.cache.invalidate()
+        self.assertEqual(self.cache.current_bytes, 0)
+        self.cache.get("inconnu")
+        self.cache.get("1007")
+        self.assertEqual(self.loaded, ["inconnu", "1007", "inconnu", "1007"])
+
+    def test_concurrent_loads_are_counted_once(self):
+        threads = [threading.Thread(target=self.cache.get, args=("1007",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loaded, ["1007"])
+        self.assertEqual(self.cache.current_bytes, 10 * 384 * 4 + 8)
+
+    def test_build_shards_missing_source_dir(self):
+        self.assertEqual(build_shards(source_dir="data/absent"), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from inference_service import (
+    HEADER, InferenceClient, handle_request, recv_message, restart_delay, send_message, serve_connection,
+)
+
+class FakeEncoder:
+    def search(self, prompt, user):
+        return f"{prompt}|{user.get('code_client', '')}"
+
+    def embed(self, texts):
+        return [[float(len(text))] for text in texts]
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_round_trip(self):
+        payload = {"op": "search", "prompt": "Qui est le créancier ?", "user": {"code_client": "100"}}
+        send_message(self.left, payload)
+        self.assertEqual(recv_message(self.right), payload)
+
+    def test_closed_connection(self):
+        self.left.sendall(HEADER.pack(10) + b"abc")
+        self.left.close()
+        with self.assertRaises(ConnectionError):
+            recv_message(self.right)
+
+    def test_malformed_frame_does_not_raise(self):
+        self.left.sendall(HEADER.pack(4) + b"\xff{[}")
+        serve_connection(self.right, FakeEncoder())
+        self.left.close()
+        self.assertEqual(self.right.recv(1), b"")
+
+    def test_stalled_peer_times_out(self):
+        self.left.sendall(HEADER.pack(100) + b"{")
+        start = time.monotonic()
+        serve_connection(self.right, FakeEncoder(), timeout=0.2)
+        self.assertLess(time.monotonic() - start, 5)
+
+class TestHandleRequest(unittest.TestCase):
+
+    def test_search(self):
+        response = handle_request({"op": "search", "prompt": "q", "user": {"code_client": "100"}}, FakeEncoder())
+        self.assertEqual(response, {"template": "q|100"})
+
+    def test_embed(self):
+        self.assertEqual(handle_request({"op": "embed", "texts": ["ab"]}, FakeEncoder()), {"embeddings": [[2.0]]})
+
+    def test_invalid_requests(self):
+        for request in ({"op": "inconnue"}, [1, 2], {"op": "search"}):
+            with self.assertRaises((ValueError, KeyError)):
+                handle_request(request, FakeEncoder())
+
+    def test_serve_connection_reports_errors(self):
+        left, right = socket.socketpair()
+        with left, right:
+            send_message(left, {"op": "inconnue"})
+            serve_connection(right, FakeEncoder())
+            self.assertIn("error", recv_message(left))
+
+class TestInferenceClient(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "inference.sock")
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        self.listener.listen()
+        self.client = InferenceClient(self.socket_path, timeout=5)
+
+    def tearDown(self):
+        self.listener.close()
+        os.unlink(self.socket_path)
+        os.rmdir(self.directory)
+
+    def serve(self, count=1):
+        def run():
+            for _ in range(count):
+                conn, _ = self.listener.accept()
+                with conn:
+                    serve_connection(conn, FakeEncoder())
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_find_response_template(self):
+        self.serve()
+        self.assertEqual(self.client.find_response_template("q", {"code_client": 100, "nom_debiteur": "x"}), "q|100")
+
+    def test_error_propagation(self):
+        self.serve()
+        with self.assertRaises(RuntimeError):
+            self.client.request({"op": "inconnue"})
+
+class TestRestartDelay(unittest.TestCase):
+
+    def test_backoff(self):
+        self.assertEqual([restart_delay(n) for n in range(4)], [0, 1, 2, 4])
+        self.assertEqual(restart_delay(20), 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import main
 from main import app
+import pytest
 import redis
+from session_cache import SessionNearCache
 from uuid import uuid4
 
 client = TestClient(app)
@@ -31,6 +35,179 @@ def test_chat_user_not_found():
     assert response.status_code == 200
     assert "Je ne trouve pas vos informations dans notre base de données." in response.json()["response"]
 
+def test_session_writer_flushes_on_threshold(monkeypatch):
+    saved = []
+    def append_history(session_id, turns, session_data=None, version=None):
+        saved.append((session_id, len(turns), version))
+        return {"history": turns}, 2
+    monkeypatch.setattr(main, "append_history", append_history)
+    writer = main.SessionWriter("s1", {"history": []}, "1", max_pending=2)
+    assert not writer.append("q1", "r1")
+    assert writer.append("q2", "r2")
+    writer.flush()
+    writer.flush()
+    assert saved == [("s1", 2, "1")]
+    assert writer.version == 2
+
+def ws_session(monkeypatch, saved, first_name="bis"):
+    session = {"user_verified": True, "first_name": first_name, "last_name": "dossier test", "code_client": "100", "history": []}
+    monkeypatch.setattr(main, "read_session", lambda session_id: (session, "1"))
+    monkeypatch.setattr(main, "find_debtor", lambda *args: {"code_client": "100", "raison_sociale_client": "CAP RECOUVREMENT"})
+    monkeypatch.setattr(main.cap_chatbot, "respond", lambda message, user: "réponse")
+    def append_history(session_id, turns, session_data=None, version=None):
+        saved.append(len(turns))
+        return session_data, version
+    monkeypatch.setattr(main, "append_history", append_history)
+
+def test_ws_chat_flushes_on_disconnect(monkeypatch):
+    saved = []
+    ws_session(monkeypatch, saved)
+    token = main.create_jwt_token({"first_name": "bis", "last_name": "dossier test", "code_client": "100"})
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": token, "session_id": "s1"})
+        websocket.send_text("[1, 2]")
+        websocket.send_json({"message": "Qui est le créancier ?"})
+        assert websocket.receive_json()["response"] == "réponse"
+        assert saved == []
+    assert saved == [1]
+
+def test_ws_chat_rejects_bad_token(monkeypatch):
+    ws_session(monkeypatch, [])
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": "invalide", "session_id": "s1"})
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_json()
+    assert exc.value.code == 1008
+
+def test_ws_chat_rejects_other_users_session(monkeypatch):
+    ws_session(monkeypatch, [], first_name="autre")
+    token = main.create_jwt_token({"first_name": "bis", "last_name": "dossier test", "code_client": "100"})
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": token, "session_id": "s1"})
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_json()
+    assert exc.value.code == 1008
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis.data.get(key))
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.redis.data.__setitem__(key, value))
+
+    def incr(self, key):
+        self.commands.append(lambda: self.redis.incr(key))
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda: True)
+
+    def execute(self):
+        self.redis.calls += 1
+        return [command() for command in self.commands]
+
+class FakeRedis:
+    """
+    Redis en mémoire : pipelines et script de sauvegarde compare-and-set de main.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.calls = 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def save_session_script(self, keys, args):
+        self.calls += 1
+        session_key, version_key = keys
+        expected, encrypted_data, _ = args
+        if self.data.get(version_key, "") != expected:
+            return [0]
+        self.data[session_key] = encrypted_data
+        return [1, self.incr(version_key)]
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(main, "redis_client", fake)
+    monkeypatch.setattr(main, "save_session_script", fake.save_session_script)
+    monkeypatch.setattr(main, "session_cache", SessionNearCache())
+    return fake
+
+def verified_session(history=None):
+    return {"user_verified": True, "first_name": "bis", "last_name": "dossier test", "code_client": "100", "history": history or []}
+
+def test_session_cache_hit_makes_no_redis_call(fake_redis):
+    main.save_session("s1", verified_session())
+    calls = fake_redis.calls
+    session_data, version = main.read_session("s1")
+    assert session_data == verified_session()
+    assert version == "1"
+    assert fake_redis.calls == calls
+    assert main.session_cache.stats()["hits"] == 1
+
+def test_session_cache_miss_reads_data_and_version(fake_redis):
+    main.save_session("s1", verified_session())
+    main.session_cache.invalidate("s1")
+    session_data, version = main.read_session("s1")
+    assert session_data == verified_session()
+    assert version == "1"
+    assert main.session_cache.version("s1") == "1"
+
+def test_session_without_version_is_not_cached(fake_redis):
+    fake_redis.data["s1"] = main.encrypt_data(verified_session())
+    session_data, version = main.read_session("s1")
+    assert version is None
+    assert main.session_cache.version("s1") is None
+    turn = {"user": "q", "bot": "r"}
+    assert main.append_history("s1", [turn], session_data, version) == (verified_session([turn]), 1)
+
+def test_saved_version_is_cached(fake_redis):
+    main.save_session("s1", verified_session())
+    main.save_session("s1", verified_session())
+    assert main.session_cache.version("s1") == "2"
+    session_data, version = main.append_history("s1", [{"user": "q", "bot": "r"}])
+    assert version == 3
+    assert main.session_cache.version("s1") == "3"
+    assert main.decrypt_data(fake_redis.data["s1"]) == session_data
+
+def test_write_from_other_worker_invalidates_entry(fake_redis):
+    main.save_session("s1", verified_session())
+    other_turn = {"user": "autre worker", "bot": "r"}
+    # Écriture d'un autre worker, dont le cache local ne voit pas la nouvelle version
+    fake_redis.save_session_script(["s1", "s1:version"], ["1", main.encrypt_data(verified_session([other_turn])), 3600])
+    session_data, version = main.read_session("s1")
+    assert version == "1"
+    turn = {"user": "q", "bot": "r"}
+    session_data, version = main.append_history("s1", [turn], session_data, version)
+    assert session_data["history"] == [other_turn, turn]
+    assert version == 3
+    assert main.session_cache.stats()["stale"] == 1
+    assert main.decrypt_data(fake_redis.data["s1"])["history"] == [other_turn, turn]
+
+def test_rest_turn_during_ws_session_is_kept(monkeypatch, fake_redis):
+    main.save_session("s1", verified_session())
+    monkeypatch.setattr(main, "find_debtor", lambda *args: {"code_client": "100", "raison_sociale_client": "CAP RECOUVREMENT"})
+    monkeypatch.setattr(main.cap_chatbot, "respond", lambda message, user: "réponse WS")
+    monkeypatch.setattr(main.cap_chatbot, "get_response", lambda *args: "réponse REST")
+    token = main.create_jwt_token({"first_name": "bis", "last_name": "dossier test", "code_client": "100"})
+    with client.websocket_connect("/ws/chat") as websocket:
+        websocket.send_json({"token": token, "session_id": "s1"})
+        websocket.send_json({"message": "question WS"})
+        assert websocket.receive_json()["response"] == "réponse WS"
+        response = client.post("/api/chat", json={"message": "question REST", "session_id": "s1"}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+    history = main.decrypt_data(fake_redis.data["s1"])["history"]
+    assert [turn["user"] for turn in history] == ["question REST", "question WS"]
+
 def clean_redis():
     # Nettoyer les sessions créées pendant les tests
     keys = redis_client.keys()
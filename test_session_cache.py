@@ -0,0 +1,44 @@
+import unittest
+from session_cache import SessionNearCache
+
+class TestSessionNearCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SessionNearCache(max_entries=2)
+        self.session = {"history": [], "user_verified": True, "first_name": "bis", "last_name": "dossier test", "code_client": "100"}
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("s1"))
+        self.cache.put("s1", 1, self.session)
+        self.assertEqual(self.cache.get("s1"), self.session)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_version_and_mark_stale(self):
+        self.cache.put("s1", 1, self.session)
+        self.assertEqual(self.cache.version("s1"), "1")
+        self.cache.mark_stale("s1")
+        self.assertIsNone(self.cache.get("s1"))
+        self.assertIsNone(self.cache.version("s1"))
+        self.assertEqual(self.cache.stats()["stale"], 1)
+        self.assertEqual(self.cache.stats()["bytes"], 0)
+
+    def test_returns_copy(self):
+        self.cache.put("s1", 1, self.session)
+        self.cache.get("s1")["history"].append({"user": "q", "bot": "r"})
+        self.assertEqual(self.cache.get("s1")["history"], [])
+
+    def test_eviction_by_count_and_bytes(self):
+        self.cache.put("s1", 1, self.session)
+        self.cache.put("s2", 1, self.session)
+        self.cache.get("s1")
+        self.cache.put("s3", 1, self.session)
+        self.assertEqual(list(self.cache.entries), ["s1", "s3"])
+
+        self.cache.max_bytes = self.cache.current_bytes - 1
+        self.cache.put("s4", 1, self.session)
+        self.assertEqual(list(self.cache.entries), ["s4"])
+        self.assertEqual(self.cache.stats()["bytes"], self.cache.current_bytes)
+
+if __name__ == '__main__':
+    unittest.main()